@@ -4,15 +4,24 @@ A dynamic Streamlit application for generating branded social media images.
 """
 
 import os
+import re
 import sys
 import json
 import io
-from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from PIL import Image, ImageDraw, ImageOps, ImageFont
+from typing import NamedTuple
+from PIL import Image, ImageChops, ImageColor, ImageDraw, ImageOps, ImageFont
 
 import streamlit as st
 
+# Optional OpenCV resize: area averaging is much faster than Lanczos for downscales
+try:
+    import cv2
+    import numpy as np
+except ImportError:
+    cv2 = None
+
 
 def get_base_path() -> Path:
     """Get the base path for the application (works with PyInstaller)."""
@@ -24,31 +33,43 @@ def get_base_path() -> Path:
         return Path(__file__).parent
 
 
-def scan_template_folders(base_path: Path) -> list[str]:
+@st.cache_data(ttl=60, show_spinner=False)
+def scan_template_folders(base_path_str: str) -> list[str]:
     """
     Scan the base directory for folders containing 'Template' in the name.
     
+    Cached for a minute so sidebar reruns don't hit the filesystem.
+    
     Args:
-        base_path: The directory to scan
+        base_path_str: The directory to scan
         
     Returns:
         List of template folder names
     """
-    templates = []
     try:
-        for item in os.listdir(base_path):
-            item_path = base_path / item
-            if item_path.is_dir() and "Template" in item:
-                templates.append(item)
+        with os.scandir(base_path_str) as it:
+            # Cheap name test first; is_dir() only runs for candidate entries
+            return sorted(entry.name for entry in it if "Template" in entry.name and entry.is_dir())
     except OSError as e:
         st.error(f"Error scanning directory: {e}")
-    return sorted(templates)
+        return []
+
+
+@st.cache_data(show_spinner=False)
+def _load_layout_cached(layout_file_str: str, mtime: float) -> dict | None:
+    with open(layout_file_str, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    # Validate once per file version rather than on every rerun
+    return config if validate_layout_config(config) else None
 
 
 def load_layout_config(template_path: Path) -> dict | None:
     """
     Load the layout.json configuration from a template folder.
     
+    The parsed and validated JSON is cached by file path and modification
+    time, so edits to layout.json are still picked up on the next rerun.
+    
     Args:
         template_path: Path to the template folder
         
@@ -61,15 +82,14 @@ def load_layout_config(template_path: Path) -> dict | None:
         return None
     
     try:
-        with open(layout_file, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-            if not validate_layout_config(config):
-                st.error(f"Invalid layout configuration in {layout_file}")
-                return None
-            return config
+        config = _load_layout_cached(str(layout_file), layout_file.stat().st_mtime)
     except json.JSONDecodeError as e:
         st.error(f"Invalid JSON in layout.json: {e}")
         return None
+    
+    if config is None:
+        st.error(f"Invalid layout configuration in {layout_file}")
+    return config
 
 
 def validate_layout_config(config: dict) -> bool:
@@ -99,6 +119,27 @@ def validate_layout_config(config: dict) -> bool:
     return valid_format(config)
 
 
+class Slot(NamedTuple):
+    """Photo slot geometry, parsed once from the layout."""
+    x: int
+    y: int
+    w: int
+    h: int
+    radius: int = 0
+    fit_mode: str = "auto"
+
+
+def parse_slots(slots: list[dict]) -> list[Slot]:
+    """Convert layout slot dicts to Slot tuples with a normalized fit mode."""
+    parsed = []
+    for slot in slots:
+        fit_mode = slot.get("fit_mode", "auto").lower()
+        if fit_mode not in {"auto", "cover", "contain"}:
+            fit_mode = "auto"
+        parsed.append(Slot(slot["x"], slot["y"], slot["w"], slot["h"], slot.get("radius", 0), fit_mode))
+    return parsed
+
+
 def get_available_formats(config: dict) -> list[str]:
     """Get list of available formats from config."""
     if "formats" in config:
@@ -111,102 +152,237 @@ def get_available_formats(config: dict) -> list[str]:
 def get_format_config(config: dict, format_name: str) -> dict:
     """Get configuration for a specific format."""
     if "formats" in config:
-        format_config = deepcopy(config["formats"].get(format_name, {}))
+        # Shallow copy is enough: callers only read the nested values
+        format_config = dict(config["formats"].get(format_name, {}))
         # Merge with global settings
         format_config["font_size"] = config.get("font_size", {})
         format_config["font_color"] = config.get("font_color", "#FFFFFF")
-        return format_config
     else:
         # Legacy format
-        return config
+        format_config = dict(config)
+    format_config["slots"] = parse_slots(format_config.get("slots", []))
+    return format_config
 
 
-def load_template_image(template_path: Path, format_config: dict) -> Image.Image | None:
+@st.cache_resource(show_spinner=False)
+def load_template_image(template_path_str: str, template_file: str, mtime: float) -> Image.Image | None:
     """
     Load the template background image.
     
+    The decoded image is shared across reruns and sessions, keyed by
+    path and modification time. Callers must copy it before drawing.
+    
     Args:
-        template_path: Path to the template folder
-        format_config: Format-specific configuration
+        template_path_str: Path to the template folder
+        template_file: Template image file name
+        mtime: Modification time of the image file (cache key only)
         
     Returns:
-        PIL Image object or None if not found
+        PIL Image object or None if it could not be loaded
     """
-    template_file = format_config.get("template_file", "1080x1350.png")
-    image_path = template_path / template_file
-    
-    if not image_path.exists():
-        st.error(f"Template image '{template_file}' not found in {template_path}")
-        return None
-    
     try:
-        return Image.open(image_path).convert("RGBA")
+        img = Image.open(Path(template_path_str) / template_file)
+        img.load()
+        # Most templates are saved as RGBA already; skip the extra allocation
+        return img if img.mode == "RGBA" else img.convert("RGBA")
     except Exception as e:
         st.error(f"Error loading template image: {e}")
         return None
 
 
-def load_font(template_path: Path, size: int) -> ImageFont.FreeTypeFont:
+@st.cache_resource(show_spinner=False)
+def load_template_preview(template_path_str: str, template_file: str, mtime: float) -> Image.Image | None:
     """
-    Load a custom font from the template folder or fallback to default.
+    Build the sidebar-sized preview of a template image.
+    
+    Cached like load_template_image, so the thumbnail is only computed
+    once per template and format rather than on every rerun.
     
     Args:
-        template_path: Path to the template folder
-        size: Font size in pixels
+        template_path_str: Path to the template folder
+        template_file: Template image file name
+        mtime: Modification time of the image file (cache key only)
         
     Returns:
-        PIL Font object
+        Thumbnail PIL Image or None if the template could not be loaded
+    """
+    template_image = load_template_image(template_path_str, template_file, mtime)
+    if template_image is None:
+        return None
+    preview = template_image.copy()
+    preview.thumbnail((400, 600), Image.Resampling.BILINEAR)
+    return preview
+
+
+SYSTEM_FONTS = [
+    "C:/Windows/Fonts/arial.ttf",
+    "C:/Windows/Fonts/arialbd.ttf",
+    "C:/Windows/Fonts/segoeui.ttf",
+    "C:/Windows/Fonts/calibri.ttf",
+    "/System/Library/Fonts/Supplemental/Arial.ttf",
+    "/System/Library/Fonts/Supplemental/Helvetica.ttc",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+]
+
+
+@st.cache_resource(show_spinner=False)
+def resolve_font_path(template_path_str: str) -> str | None:
     """
-    # Try to find a .ttf file in the template folder
-    ttf_files = list(template_path.glob("*.ttf"))
+    Find the font file to use for a template folder.
     
-    if ttf_files:
+    The template's own .ttf wins, then the system font.
+    Cached across reruns, so each folder is scanned (and its font
+    validated) once per process.
+    
+    Args:
+        template_path_str: Path to the template folder
+        
+    Returns:
+        Path to a font file or None to use the default font
+    """
+    # Try to find a .ttf file in the template folder, then the system font
+    candidates = []
+    try:
+        with os.scandir(template_path_str) as it:
+            ttf_path = next(
+                (entry.path for entry in it if entry.name.lower().endswith(".ttf") and entry.is_file()),
+                None
+            )
+        if ttf_path:
+            candidates.append(ttf_path)
+    except OSError:
+        pass
+    system_font = next((font_path for font_path in SYSTEM_FONTS if os.path.exists(font_path)), None)
+    if system_font:
+        candidates.append(system_font)
+    
+    for candidate in candidates:
         try:
-            return ImageFont.truetype(str(ttf_files[0]), size)
+            ImageFont.truetype(candidate, 12)
         except Exception:
-            pass
+            continue
+        return candidate
+    return None
+
+
+@st.cache_resource(show_spinner=False)
+def load_font(font_path: str | None, size: int) -> ImageFont.FreeTypeFont:
+    """
+    Load a font file at the given size or fallback to default.
     
-    # Try common system fonts
-    system_fonts = [
-        "C:/Windows/Fonts/arial.ttf",
-        "C:/Windows/Fonts/arialbd.ttf",
-        "C:/Windows/Fonts/segoeui.ttf",
-        "C:/Windows/Fonts/calibri.ttf",
-        "/System/Library/Fonts/Supplemental/Arial.ttf",
-        "/System/Library/Fonts/Supplemental/Helvetica.ttc",
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
-        "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
-    ]
+    Fonts are cached per (font file, size), so repeated renders and
+    templates sharing a font reuse the same object instead of re-reading
+    the file.
     
-    for font_path in system_fonts:
-        if os.path.exists(font_path):
-            try:
-                return ImageFont.truetype(font_path, size)
-            except Exception:
-                continue
+    Args:
+        font_path: Font file from resolve_font_path, or None
+        size: Font size in pixels
+        
+    Returns:
+        PIL Font object
+    """
+    if font_path:
+        try:
+            return ImageFont.truetype(font_path, size)
+        except Exception:
+            pass
     
     # Fallback to default
     return ImageFont.load_default()
 
 
-def create_rounded_mask(size: tuple[int, int], radius: int) -> Image.Image:
+@st.cache_resource(show_spinner=False, max_entries=64)
+def create_rounded_mask(w: int, h: int, radius: int) -> Image.Image:
     """
     Create a rounded rectangle mask.
     
+    Masks are cached by geometry across reruns and shared, so treat the
+    result as read-only.
+    
     Args:
-        size: (width, height) of the mask
+        w: Width of the mask
+        h: Height of the mask
         radius: Corner radius in pixels
         
     Returns:
         PIL Image mask with rounded corners
     """
-    mask = Image.new("L", size, 0)
+    mask = Image.new("L", (w, h), 0)
     draw = ImageDraw.Draw(mask)
-    draw.rounded_rectangle([(0, 0), (size[0] - 1, size[1] - 1)], radius=radius, fill=255)
+    draw.rounded_rectangle([(0, 0), (w - 1, h - 1)], radius=radius, fill=255)
     return mask
 
 
-def process_photo(photo: Image.Image, slot: dict) -> Image.Image:
+def load_uploaded_photo(uploaded_file, max_side: int) -> Image.Image:
+    """
+    Decode an uploaded photo as RGBA.
+    
+    JPEGs are decoded straight at a reduced scale (libjpeg DCT scaling)
+    while staying at least twice the largest slot side. EXIF orientation
+    from phone photos is applied here, once per upload, so later resizes
+    work on an upright image.
+    
+    Args:
+        uploaded_file: File-like object from the uploader
+        max_side: Largest slot width or height the photo may fill
+        
+    Returns:
+        Upright PIL Image in RGBA mode
+    """
+    img = Image.open(uploaded_file)
+    # Square request box so the bound holds whichever way EXIF rotates the photo
+    img.draft("RGB", (max_side * 2, max_side * 2))
+    img = ImageOps.exif_transpose(img)
+    return img.convert("RGBA")
+
+
+def cover_box(photo_size: tuple[int, int], size: tuple[int, int]) -> tuple[float, float, float, float]:
+    """Centered crop box of the photo matching the aspect ratio of size."""
+    src_w, src_h = photo_size
+    if src_w / src_h >= size[0] / size[1]:
+        crop_w, crop_h = size[0] / size[1] * src_h, src_h
+    else:
+        crop_w, crop_h = src_w, size[1] / size[0] * src_w
+    left = (src_w - crop_w) / 2
+    top = (src_h - crop_h) / 2
+    return (left, top, left + crop_w, top + crop_h)
+
+
+def resize_photo(
+    photo: Image.Image,
+    size: tuple[int, int],
+    box: tuple[float, float, float, float] | None = None
+) -> Image.Image:
+    """
+    Resize a photo (or a region of it) to the given size.
+    
+    Downscales of fully opaque regions use OpenCV's INTER_AREA when it is
+    installed; everything else goes through Pillow's Lanczos filter, which
+    premultiplies alpha.
+    
+    Args:
+        photo: RGBA source image
+        size: Output (width, height)
+        box: Optional source region to resize, defaults to the whole photo
+        
+    Returns:
+        Resized RGBA image
+    """
+    if box is None:
+        box = (0, 0, photo.width, photo.height)
+    
+    if cv2 is not None and box[2] - box[0] >= size[0] and box[3] - box[1] >= size[1]:
+        region = photo.crop(tuple(round(v) for v in box))
+        # INTER_AREA averages straight alpha, which would bleed the hidden
+        # color of transparent pixels into the edges
+        if region.getchannel("A").getextrema() == (255, 255):
+            return Image.fromarray(cv2.resize(np.asarray(region), size, interpolation=cv2.INTER_AREA))
+    
+    return photo.resize(size, Image.Resampling.LANCZOS, box=box)
+
+
+def process_photo(photo: Image.Image, slot: Slot) -> Image.Image:
     """
     Process a user photo to fit a slot.
 
@@ -216,80 +392,135 @@ def process_photo(photo: Image.Image, slot: dict) -> Image.Image:
     - auto (default): uses contain when crop would be too aggressive
     
     Args:
-        photo: PIL Image of the user's photo
-        slot: Slot configuration with x, y, w, h, radius
+        photo: PIL Image of the user's photo, already upright and RGBA
+        slot: Parsed slot with size, radius and fit mode
         
     Returns:
         Processed PIL Image with rounded corners
     """
-    width = slot["w"]
-    height = slot["h"]
-    radius = slot.get("radius", 0)
-    fit_mode = slot.get("fit_mode", "auto").lower()
-
-    # Respect EXIF orientation from phone photos before any resize
-    normalized = ImageOps.exif_transpose(photo)
+    width, height, radius, fit_mode = slot.w, slot.h, slot.radius, slot.fit_mode
 
-    if fit_mode not in {"auto", "cover", "contain"}:
-        fit_mode = "auto"
-
-    photo_ratio = normalized.width / normalized.height if normalized.height else 1
+    photo_ratio = photo.width / photo.height if photo.height else 1
     slot_ratio = width / height if height else 1
     ratio_diff = max(photo_ratio, slot_ratio) / min(photo_ratio, slot_ratio) if min(photo_ratio, slot_ratio) else 1
 
     # Auto mode: avoid heavy crop on very different aspect ratios
     use_contain = fit_mode == "contain" or (fit_mode == "auto" and ratio_diff > 1.2)
 
+    # Big uploads: cheap box reduction down to ~2x the slot before the Lanczos pass
+    scale = min(photo.width / width, photo.height / height) if width and height else 1
+    if scale > 3 and int(scale // 2) > 1:
+        photo = photo.reduce(int(scale // 2))
+
     if use_contain:
-        fitted = ImageOps.contain(normalized, (width, height), method=Image.Resampling.LANCZOS)
+        # Largest size with the photo's aspect ratio that fits in the slot
+        if photo.width / photo.height > width / height:
+            fit_size = (width, max(1, round(photo.height / photo.width * width)))
+        else:
+            fit_size = (max(1, round(photo.width / photo.height * height)), height)
+        fitted = resize_photo(photo, fit_size)
         canvas = Image.new("RGBA", (width, height), (0, 0, 0, 0))
         offset_x = (width - fitted.width) // 2
         offset_y = (height - fitted.height) // 2
         canvas.paste(fitted, (offset_x, offset_y))
         fitted = canvas
     else:
-        # Cover mode: fills entire slot
-        fitted = ImageOps.fit(normalized, (width, height), method=Image.Resampling.LANCZOS)
-    
-    # Convert to RGBA if needed
-    if fitted.mode != "RGBA":
-        fitted = fitted.convert("RGBA")
+        # Cover mode: center-crop to the slot ratio, then fill the entire slot
+        fitted = resize_photo(photo, (width, height), cover_box(photo.size, (width, height)))
     
     # Apply rounded corners if specified
     if radius > 0:
-        mask = create_rounded_mask((width, height), radius)
-        # Create transparent background
-        result = Image.new("RGBA", (width, height), (0, 0, 0, 0))
-        result.paste(fitted, (0, 0), mask)
-        return result
+        mask = create_rounded_mask(width, height, radius)
+        # Scale the photo's own alpha by the mask (fitted is always a fresh image)
+        fitted.putalpha(ImageChops.multiply(fitted.getchannel("A"), mask))
     
     return fitted
 
 
-def composite_images(
-    template: Image.Image,
-    photos: list[Image.Image],
-    slots: list[dict]
-) -> Image.Image:
+def fit_uploaded_photo(uploaded_file, max_side: int, slots: list[Slot]) -> list[Image.Image]:
     """
-    Composite user photos onto the template at specified slots.
+    Decode one upload and fit it to each of the given slots.
+    
+    The full-size decode only lives for the duration of this call, so
+    memory holds slot-sized photos rather than every decoded upload.
+    Safe to run in a worker thread (only Streamlit call is the mask cache).
     
     Args:
-        template: Background template image
-        photos: List of user photos
-        slots: List of slot configurations
+        uploaded_file: File-like object from the uploader
+        max_side: Largest slot width or height of the format
+        slots: Slots this photo fills
         
     Returns:
-        Composited PIL Image
+        Processed photos, one per slot
     """
-    result = template.copy()
+    photo = load_uploaded_photo(uploaded_file, max_side)
+    return [process_photo(photo, slot) for slot in slots]
+
+
+def fit_text_to_width(text: str, font: ImageFont.FreeTypeFont, max_width: int) -> str:
+    """
+    Truncate text with an ellipsis so it fits in max_width pixels.
+    
+    Text that already fits costs a single measurement; longer text is
+    binary-searched rather than trimmed one character at a time.
+    """
+    if max_width <= 0:
+        return text
+    if font.getlength(text) <= max_width:
+        return text
+
+    ellipsis = "..."
+    if font.getlength(ellipsis) > max_width:
+        return ""
+
+    # Binary search the longest prefix that still fits with the ellipsis
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if font.getlength(f"{text[:mid]}{ellipsis}") <= max_width:
+            lo = mid
+        else:
+            hi = mid - 1
+    return f"{text[:lo]}{ellipsis}" if lo else ""
+
+
+@st.cache_resource(show_spinner=False, max_entries=256)
+def render_text_mask(text: str, font_path: str | None, size: int, anchor: str) -> tuple[Image.Image, int, int] | None:
+    """
+    Rasterize a line of text into a grayscale mask.
     
-    for i, (photo, slot) in enumerate(zip(photos, slots)):
-        processed = process_photo(photo, slot)
-        x, y = slot["x"], slot["y"]
-        result.paste(processed, (x, y), processed)
+    Masks are cached per (text, font file, size, anchor) across reruns,
+    so fields that don't change between renders (store phone, address...)
+    skip FreeType entirely. Treat the returned mask as read-only.
     
-    return result
+    Args:
+        text: Text to rasterize
+        font_path: Font file from resolve_font_path, or None
+        size: Font size in pixels
+        anchor: PIL text anchor, e.g. "lt" or "rt"
+        
+    Returns:
+        (mask, left, top) with the mask offset from the anchor point,
+        or None when the text has no visible pixels
+    """
+    font = load_font(font_path, size)
+    left, top, right, bottom = font.getbbox(text, anchor=anchor)
+    if right <= left or bottom <= top:
+        return None
+    
+    mask = Image.new("L", (right - left, bottom - top), 0)
+    ImageDraw.Draw(mask).text((-left, -top), text, font=font, fill=255, anchor=anchor)
+    return mask, left, top
+
+
+def has_text_work(format_config: dict, texts) -> bool:
+    """Whether render_text would draw anything (text, panels or clear areas)."""
+    has_text = any(texts)
+    has_panels = bool(format_config.get("text_panels"))
+    has_clears = format_config.get("clear_text_areas", True) and bool(
+        format_config.get("text_clear_area_left") or format_config.get("text_clear_area_right")
+    )
+    return bool(has_text or has_panels or has_clears)
 
 
 def render_text(
@@ -309,8 +540,13 @@ def render_text(
     """
     Render text onto the image at specified positions.
     First clears placeholder text areas, then draws user text.
+    Draws in place on image (which must not be a shared cached image)
+    and returns it; returns early when there is nothing to draw.
     """
-    result = image.copy()
+    if not has_text_work(format_config, [model, price, year, km, plate, vendedor, telefone, unidade, endereco]):
+        return image
+
+    result = image
     draw = ImageDraw.Draw(result)
 
     # Optional modern text panels to improve readability/visual hierarchy.
@@ -325,6 +561,18 @@ def render_text(
     font_sizes = format_config.get("font_size", {})
     font_color = format_config.get("font_color", "#FFFFFF")
     text_align_right = format_config.get("text_align_right", [])
+    left_area = format_config.get("text_clear_area_left")
+    right_area = format_config.get("text_clear_area_right")
+    
+    # Resolve inks once for all fields. Soft shadow for better legibility on
+    # detailed backgrounds; skipped entirely when it would be invisible.
+    fg_ink = ImageColor.getcolor(font_color, "RGBA")
+    shadow_dx, shadow_dy = format_config.get("text_shadow_offset", [2, 2])
+    shadow_ink = tuple(format_config.get("text_shadow_color", [0, 0, 0, 140]))
+    if len(shadow_ink) == 3:
+        shadow_ink += (255,)
+    if not (shadow_dx or shadow_dy) or shadow_ink[3] == 0:
+        shadow_ink = None
     
     # Clear placeholder text areas only when explicitly enabled in layout.
     if format_config.get("clear_text_areas", True):
@@ -334,79 +582,104 @@ def render_text(
                 x1, y1, x2, y2 = area
                 draw.rectangle([(x1, y1), (x2, y2)], fill="#1a1a1a")
     
-    # Load fonts
-    model_font = load_font(template_path, font_sizes.get("modelo", 42))
-    price_font = load_font(template_path, font_sizes.get("preco", 28))
-    default_font = load_font(template_path, font_sizes.get("default", 22))
-
-    def fit_text_to_width(text: str, font: ImageFont.ImageFont, max_width: int) -> str:
-        if max_width <= 0:
-            return text
-        if draw.textlength(text, font=font) <= max_width:
-            return text
-
-        ellipsis = "..."
-        if draw.textlength(ellipsis, font=font) > max_width:
-            return ""
-
-        truncated = text
-        while truncated and draw.textlength(f"{truncated}{ellipsis}", font=font) > max_width:
-            truncated = truncated[:-1]
-        return f"{truncated}{ellipsis}" if truncated else ""
-
-    def draw_text_field(key, text, font):
-        if text and key in text_pos:
-            x, y = text_pos[key]
-            # Use top anchors so configured Y means top of line block (predictable spacing).
-            anchor = "rt" if key in text_align_right else "lt"
-            max_width = 0
-            if anchor == "lt":
-                # left text limited by left clear area when available
-                left_area = format_config.get("text_clear_area_left")
-                if left_area:
-                    max_width = left_area[2] - x
-            else:
-                # right text limited by right clear area when available
-                right_area = format_config.get("text_clear_area_right")
-                if right_area:
-                    max_width = x - right_area[0]
-
-            display_text = fit_text_to_width(text, font, max_width) if max_width else text
-            # Soft shadow for better legibility on detailed backgrounds.
-            shadow_offset = format_config.get("text_shadow_offset", [2, 2])
-            shadow_color = tuple(format_config.get("text_shadow_color", [0, 0, 0, 140]))
-            draw.text(
-                (x + shadow_offset[0], y + shadow_offset[1]),
-                display_text,
-                font=font,
-                fill=shadow_color,
-                anchor=anchor,
-            )
-            draw.text((x, y), display_text, font=font, fill=font_color, anchor=anchor)
-    
-    # Left side - Vehicle info
-    draw_text_field("modelo", model, model_font)
-    draw_text_field("preco", price, price_font)
-    draw_text_field("ano", year, default_font)
-    
+    font_path = resolve_font_path(str(template_path))
+    model_size = font_sizes.get("modelo", 42)
+    price_size = font_sizes.get("preco", 28)
+    default_size = font_sizes.get("default", 22)
+    fonts = {size: load_font(font_path, size) for size in {model_size, price_size, default_size}}
+
     km_text = f"Km {km}" if km and not km.lower().startswith("km") else km
-    draw_text_field("km", km_text, default_font)
-    
     plate_text = f"Final de placa {plate}" if plate else ""
-    draw_text_field("placa", plate_text, default_font)
+    fields = [
+        # Left side - Vehicle info
+        ("modelo", model, model_size),
+        ("preco", price, price_size),
+        ("ano", year, default_size),
+        ("km", km_text, default_size),
+        ("placa", plate_text, default_size),
+        # Right side - Seller info
+        ("vendedor", vendedor, default_size),
+        ("telefone", telefone, default_size),
+        ("unidade", unidade, default_size),
+        ("endereco", endereco, default_size),
+    ]
     
-    # Right side - Seller info
-    draw_text_field("vendedor", vendedor, default_font)
-    draw_text_field("telefone", telefone, default_font)
-    draw_text_field("unidade", unidade, default_font)
-    draw_text_field("endereco", endereco, default_font)
+    for key, text, size in fields:
+        if not text or key not in text_pos:
+            continue
+        x, y = text_pos[key]
+        # Use top anchors so configured Y means top of line block (predictable spacing).
+        anchor = "rt" if key in text_align_right else "lt"
+        max_width = 0
+        if anchor == "lt":
+            # left text limited by left clear area when available
+            if left_area:
+                max_width = left_area[2] - x
+        else:
+            # right text limited by right clear area when available
+            if right_area:
+                max_width = x - right_area[0]
+
+        display_text = fit_text_to_width(text, fonts[size], max_width) if max_width else text
+        # One cached glyph mask, tinted for both shadow and text.
+        text_mask = render_text_mask(display_text, font_path, size, anchor)
+        if text_mask is None:
+            continue
+        mask, left, top = text_mask
+        # paste boxes must be integers; layout.json may hold float positions
+        x, y = int(x) + left, int(y) + top
+
+        if shadow_ink:
+            sx, sy = x + int(shadow_dx), y + int(shadow_dy)
+            result.paste(shadow_ink, (sx, sy, sx + mask.width, sy + mask.height), mask)
+        result.paste(fg_ink, (x, y, x + mask.width, y + mask.height), mask)
     
     return result
 
 
+def render_card(
+    template: Image.Image,
+    photos: list[Image.Image],
+    slots: list[Slot],
+    format_config: dict,
+    template_path: Path,
+    **text_fields: str
+) -> Image.Image:
+    """
+    Build the final card on a single copy of the template.
+    
+    Fitted photos are composited at their slots, then text is drawn on
+    the same surface, so the whole render costs one full-size copy.
+    
+    Args:
+        template: Background template image (shared, never modified)
+        photos: List of photos already fitted to their slots
+        slots: List of parsed slots
+        format_config: Format-specific configuration
+        template_path: Path to the template folder (for fonts)
+        **text_fields: Text values passed on to render_text
+        
+    Returns:
+        Final card as a PIL Image (the template itself when nothing is drawn)
+    """
+    if not (photos and slots) and not has_text_work(format_config, text_fields.values()):
+        return template
+    
+    result = template.copy()
+    
+    for photo, slot in zip(photos, slots):
+        # Blend only the slot region instead of a generic paste with mask
+        result.alpha_composite(photo, (slot.x, slot.y))
+    
+    return render_text(result, format_config, template_path, **text_fields)
+
+
+_NON_DIGITS_RE = re.compile(r"\D+")
+
+
 def format_price_value(raw: str) -> str:
     """Format a raw string into Brazilian currency: R$ X.XXX,XX"""
-    digits = ''.join(c for c in raw if c.isdigit())
+    digits = _NON_DIGITS_RE.sub("", raw)
     if not digits:
         return ""
     # Treat as cents (last 2 digits)
@@ -421,7 +694,7 @@ def format_price_value(raw: str) -> str:
 
 def format_km_value(raw: str) -> str:
     """Format a raw string with dot thousand separators for KM."""
-    digits = ''.join(c for c in raw if c.isdigit())
+    digits = _NON_DIGITS_RE.sub("", raw)
     if not digits:
         return ""
     number = int(digits)
@@ -430,7 +703,7 @@ def format_km_value(raw: str) -> str:
 
 def format_year_value(raw: str) -> str:
     """Format a raw string as YYYY/YYYY for year field."""
-    digits = ''.join(c for c in raw if c.isdigit())
+    digits = _NON_DIGITS_RE.sub("", raw)
     if not digits:
         return ""
     digits = digits[:8]  # Max 8 digits (2 years)
@@ -460,10 +733,64 @@ def _on_year_change():
 def image_to_bytes(image: Image.Image, format: str = "PNG") -> bytes:
     """Convert PIL Image to bytes for download."""
     buffer = io.BytesIO()
-    image.save(buffer, format=format)
+    if format == "JPEG":
+        # JPEG has no alpha channel; much smaller file for sharing
+        image.convert("RGB").save(buffer, format=format, quality=92)
+    else:
+        # Low zlib level: several times faster to encode for a slightly larger file
+        image.save(buffer, format=format, compress_level=1, optimize=False)
     return buffer.getvalue()
 
 
+# Predefined store locations: name -> (phone, address)
+LOJAS = {
+    "-- Selecione a Unidade --": ("", ""),
+    "Bexp Audi Alphaville": (
+        "(11) 4196-1011",
+        "Alameda Araguaia, 1993 - Alphaville, Barueri"
+    ),
+    "Bexp Jeep Brooklin": (
+        "(11) 5102-5555",
+        "Av. Jurubatuba, 33 - Vila Cordeiro, São Paulo"
+    ),
+    "Bexp Jeep Butantã": (
+        "(11) 3723-2099",
+        "Av. Corifeu de Azevedo Marques, 152 - Butantã, SP"
+    ),
+    "Bexp Jeep Morumbi": (
+        "(11) 2150-0000",
+        "Av. Giovanni Gronchi, 6328 - Vila Andrade, SP"
+    ),
+    "Duo Porsche": (
+        "(11) 4196-1020",
+        "Av. Heitor Penteado, 800 - Sumarezinho, SP"
+    ),
+    "Duo Porsche Alphaville": (
+        "(11) 2150-0030",
+        "Alameda Araguaia, 2011 - Alphaville, Barueri"
+    ),
+    "Duo Porsche Vila Leopoldina": (
+        "(11) 4196-1030",
+        "Av. Dr. Gastão Vidigal - Vila Leopoldina, SP"
+    ),
+}
+LOJA_KEYS = tuple(LOJAS.keys())
+
+FORMAT_LABELS = {
+    "1080x1350": "📱 Instagram Feed (1080x1350)",
+    "1080x1080": "⬜ Quadrado (1080x1080)",
+    "1080x1920": "📲 Stories (1080x1920)",
+    "1080x566": "🖼️ Banner/Capa (1080x566)",
+    "default": "📄 Padrão"
+}
+
+
+@st.cache_resource(show_spinner=False)
+def get_encode_pool() -> ThreadPoolExecutor:
+    """Shared worker pool for PNG encoding (Pillow releases the GIL while encoding)."""
+    return ThreadPoolExecutor(max_workers=2)
+
+
 def main():
     """Main Streamlit application."""
     st.set_page_config(
@@ -478,7 +805,7 @@ def main():
     base_path = get_base_path()
     
     # Scan for template folders
-    templates = scan_template_folders(base_path)
+    templates = scan_template_folders(str(base_path))
     
     if not templates:
         st.error("Nenhuma pasta de template encontrada. Certifique-se de que existem pastas com 'Template' no nome.")
@@ -504,18 +831,11 @@ def main():
         available_formats = get_available_formats(config)
         
         st.header("📐 Formato")
-        format_labels = {
-            "1080x1350": "📱 Instagram Feed (1080x1350)",
-            "1080x1080": "⬜ Quadrado (1080x1080)",
-            "1080x1920": "📲 Stories (1080x1920)",
-            "1080x566": "🖼️ Banner/Capa (1080x566)",
-            "default": "📄 Padrão"
-        }
         
         selected_format = st.selectbox(
             "Escolha o formato:",
             available_formats,
-            format_func=lambda x: format_labels.get(x, x)
+            format_func=lambda x: FORMAT_LABELS.get(x, x)
         )
         
         st.divider()
@@ -527,7 +847,15 @@ def main():
     format_config = get_format_config(config, selected_format)
     
     # Load template image
-    template_image = load_template_image(template_path, format_config)
+    template_file = format_config.get("template_file", "1080x1350.png")
+    image_path = template_path / template_file
+    
+    if not image_path.exists():
+        st.error(f"Template image '{template_file}' not found in {template_path}")
+        return
+    
+    template_mtime = image_path.stat().st_mtime
+    template_image = load_template_image(str(template_path), template_file, template_mtime)
     
     if not template_image:
         return
@@ -565,42 +893,9 @@ def main():
         
         vendedor = st.text_input("Nome do Vendedor", placeholder="Ex: João Silva")
         
-        # Predefined store locations
-        LOJAS = {
-            "-- Selecione a Unidade --": ("", ""),
-            "Bexp Audi Alphaville": (
-                "(11) 4196-1011",
-                "Alameda Araguaia, 1993 - Alphaville, Barueri"
-            ),
-            "Bexp Jeep Brooklin": (
-                "(11) 5102-5555",
-                "Av. Jurubatuba, 33 - Vila Cordeiro, São Paulo"
-            ),
-            "Bexp Jeep Butantã": (
-                "(11) 3723-2099",
-                "Av. Corifeu de Azevedo Marques, 152 - Butantã, SP"
-            ),
-            "Bexp Jeep Morumbi": (
-                "(11) 2150-0000",
-                "Av. Giovanni Gronchi, 6328 - Vila Andrade, SP"
-            ),
-            "Duo Porsche": (
-                "(11) 4196-1020",
-                "Av. Heitor Penteado, 800 - Sumarezinho, SP"
-            ),
-            "Duo Porsche Alphaville": (
-                "(11) 2150-0030",
-                "Alameda Araguaia, 2011 - Alphaville, Barueri"
-            ),
-            "Duo Porsche Vila Leopoldina": (
-                "(11) 4196-1030",
-                "Av. Dr. Gastão Vidigal - Vila Leopoldina, SP"
-            ),
-        }
-        
         loja_selecionada = st.selectbox(
             "Selecione a Unidade",
-            options=list(LOJAS.keys())
+            options=LOJA_KEYS
         )
         
         # Get predefined values
@@ -639,8 +934,7 @@ def main():
         st.subheader("👁️ Prévia do Template")
         
         # Show template preview
-        preview_template = template_image.copy()
-        preview_template.thumbnail((400, 600))
+        preview_template = load_template_preview(str(template_path), template_file, template_mtime)
         st.image(preview_template, caption=f"Template: {selected_template} - {selected_format}")
     
     st.divider()
@@ -660,27 +954,44 @@ def main():
         if len(uploaded_files) < num_slots:
             st.warning(f"O template possui {num_slots} slots. Você enviou {len(uploaded_files)} foto(s). As fotos serão repetidas.")
         
-        # Load and process photos
-        photos = []
-        for f in uploaded_files:
-            try:
-                img = Image.open(f).convert("RGBA")
-                photos.append(img)
-            except Exception as e:
-                st.error(f"Erro ao carregar imagem {f.name}: {e}")
-                return
-        
-        # Repeat photos if needed to fill all slots
-        while len(photos) < num_slots:
-            photos.append(photos[len(photos) % len(uploaded_files)])
-        
-        # Composite images
+        # Fitted photos are kept per (upload, decode size, slot) across reruns, so
+        # regenerating after a text edit neither decodes nor resizes again
+        max_side = max(max(slot.w, slot.h) for slot in slots)
+        fit_cache = st.session_state.get("fit_cache", {})
+        
+        # Slots each upload fills (photos repeat when there are fewer than slots)
+        num_uploads = len(uploaded_files)
+        slot_keys = [(uploaded_files[i % num_uploads].file_id, max_side, slot) for i, slot in enumerate(slots)]
+        upload_slots = [(f, slots[i::num_uploads]) for i, f in enumerate(uploaded_files[:num_slots])]
+        missing = [
+            (f, f_slots) for f, f_slots in upload_slots
+            if any((f.file_id, max_side, slot) not in fit_cache for slot in f_slots)
+        ]
+        
+        # Composite photos and text
         with st.spinner("Processando imagens..."):
-            result = composite_images(template_image, photos[:num_slots], slots)
+            if missing:
+                # Decoding and resizing run in Pillow's C code without the GIL, so
+                # uploads are processed in parallel, each decode dropped once fitted
+                with ThreadPoolExecutor(max_workers=min(8, len(missing))) as pool:
+                    futures = [(f, f_slots, pool.submit(fit_uploaded_photo, f, max_side, f_slots)) for f, f_slots in missing]
+                for f, f_slots, future in futures:
+                    try:
+                        for slot, fitted_photo in zip(f_slots, future.result()):
+                            fit_cache[(f.file_id, max_side, slot)] = fitted_photo
+                    except Exception as e:
+                        st.error(f"Erro ao carregar imagem {f.name}: {e}")
+                        return
             
-            # Render text
-            result = render_text(
-                result,
+            # Keep only what this card uses so old uploads are released
+            fit_cache = {key: fit_cache[key] for key in slot_keys}
+            st.session_state["fit_cache"] = fit_cache
+            fitted = [fit_cache[key] for key in slot_keys]
+            
+            result = render_card(
+                template_image,
+                fitted,
+                slots,
                 format_config,
                 template_path,
                 model=model,
@@ -694,31 +1005,41 @@ def main():
                 endereco=endereco
             )
         
+        # Start the download encodes in the background while the preview is sent
+        st.session_state["png_future"] = get_encode_pool().submit(image_to_bytes, result)
+        st.session_state["jpeg_future"] = get_encode_pool().submit(image_to_bytes, result, "JPEG")
+        
         # Display result
         st.subheader("✨ Resultado")
         st.image(result, caption="Card gerado", use_container_width=True)
         
-        # Store in session state for download
-        st.session_state["generated_image"] = result
+        # Store in session state for download (only the encoded bytes are kept)
         st.session_state["model_name"] = model or "card"
         st.session_state["selected_format"] = selected_format
     
-    # Download button
+    # Download buttons
     with download_col:
-        if "generated_image" in st.session_state:
-            img_bytes = image_to_bytes(st.session_state["generated_image"])
+        if "png_future" in st.session_state:
+            # Encoded once per generated card; later reruns get the finished bytes
             model_name = st.session_state.get('model_name', 'card')
             format_name = st.session_state.get('selected_format', '')
-            filename = f"{model_name}_{format_name}.png"
+            filename = f"{model_name}_{format_name}"
             filename = "".join(c for c in filename if c.isalnum() or c in "._- ")
             
             st.download_button(
                 label="⬇️ Baixar Card (PNG)",
-                data=img_bytes,
-                file_name=filename,
+                data=st.session_state["png_future"].result(),
+                file_name=f"{filename}.png",
                 mime="image/png",
                 use_container_width=True
             )
+            st.download_button(
+                label="⬇️ Baixar Card (JPG, menor)",
+                data=st.session_state["jpeg_future"].result(),
+                file_name=f"{filename}.jpg",
+                mime="image/jpeg",
+                use_container_width=True
+            )
 
 
 if __name__ == "__main__":
@@ -8,7 +8,6 @@ Usage:
        pyinstaller --onefile --add-data "Template Audi;Template Audi" --add-data "Template Porsche;Template Porsche" --add-data "Template Jeep;Template Jeep" --add-data "Template BEXP;Template BEXP" run_app.py
 """
 
-import subprocess
 import sys
 import os
 from pathlib import Path
@@ -34,16 +33,11 @@ def main():
         print(f"Error: app.py not found at {app_path}")
         sys.exit(1)
     
-    # Build the streamlit command
-    cmd = [
-        sys.executable,
-        "-m",
-        "streamlit",
-        "run",
-        str(app_path),
-        "--server.headless=true",
-        "--browser.gatherUsageStats=false"
-    ]
+    # Streamlit config options (same as the --server.* / --browser.* CLI flags)
+    flag_options = {
+        "server.headless": True,
+        "browser.gatherUsageStats": False,
+    }
     
     print("=" * 50)
     print("AutoPost - Multi-Brand Social Media Generator")
@@ -55,9 +49,13 @@ def main():
     print()
     
     try:
-        # Run streamlit
-        process = subprocess.run(cmd, cwd=str(app_path.parent))
-        sys.exit(process.returncode)
+        # Run streamlit in this interpreter instead of spawning a second one
+        from streamlit.web import bootstrap
+        
+        os.chdir(app_path.parent)
+        bootstrap.load_config_options(flag_options=flag_options)
+        bootstrap.run(str(app_path), is_hello=False, args=[], flag_options=flag_options)
+        sys.exit(0)
     except KeyboardInterrupt:
         print("\nServer stopped.")
         sys.exit(0)